@@ -2,67 +2,295 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import io
+import hashlib
+import datetime
+import xlsxwriter
+from concurrent.futures import ThreadPoolExecutor
 
-# Function to load the uploaded file
-@st.cache_data
+PREVIEW_ROWS = 500
+MAX_HIGHLIGHT_ROWS = 1000
+
+EXCEL_FILE_TYPES = ["application/vnd.ms-excel", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"]
+
+# Hash each upload once; reruns reuse the digest instead of rehashing the whole buffer
+def file_digest(uploaded_file):
+    key = f"file_digest_{uploaded_file.file_id}"
+    if key not in st.session_state:
+        st.session_state[key] = hashlib.blake2b(uploaded_file.getvalue(), digest_size=16).hexdigest()
+    return st.session_state[key]
+
+# Sheet names come from the workbook metadata, so no cells are parsed until a sheet is picked.
+# The cached parsers are keyed on the content digest; the leading underscore keeps
+# Streamlit from hashing the raw bytes again on every rerun.
+@st.cache_data(ttl=24 * 60 * 60, show_spinner=False)
+def list_sheets(digest, _file_bytes, file_type):
+    if file_type in EXCEL_FILE_TYPES:
+        return pd.ExcelFile(io.BytesIO(_file_bytes), engine="calamine").sheet_names
+    return ["Sheet1"]
+
+# Function to parse one sheet of the raw file contents, cached so reruns skip re-reading
+@st.cache_data(ttl=24 * 60 * 60, show_spinner=False)
+def parse_sheet(digest, _file_bytes, file_type, sheet_name):
+    if file_type in EXCEL_FILE_TYPES:
+        return pd.read_excel(io.BytesIO(_file_bytes), sheet_name=sheet_name, engine="calamine")
+    # The pyarrow engine keeps repeated or blank header names as-is, so those files go
+    # through the C engine, which renames them to unique 'a.1' / 'Unnamed: 1' labels
+    header = pd.read_csv(io.BytesIO(_file_bytes), header=None, nrows=1, dtype=str).iloc[0]
+    if header.isna().any() or header.duplicated().any():
+        return pd.read_csv(io.BytesIO(_file_bytes), dtype_backend="pyarrow")
+    # Short rows are an error for the pyarrow engine, and it turns offset timestamps into
+    # UTC values that no longer match the file's text (and that Excel cannot store),
+    # so those files also go through the C engine, which leaves them as written
+    try:
+        df = pd.read_csv(io.BytesIO(_file_bytes), engine="pyarrow", dtype_backend="pyarrow")
+    except ValueError:
+        return pd.read_csv(io.BytesIO(_file_bytes), dtype_backend="pyarrow")
+    if any(getattr(getattr(dtype, "pyarrow_dtype", None), "tz", None) for dtype in df.dtypes):
+        return pd.read_csv(io.BytesIO(_file_bytes), dtype_backend="pyarrow")
+    return df
+
+# Function to load the sheet names of the uploaded file
 def load_file(uploaded_file):
     file_type = uploaded_file.type
-    if file_type in ["application/vnd.ms-excel", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"]:
-        return pd.read_excel(uploaded_file, sheet_name=None)
-    elif file_type == "text/csv":
-        df = pd.read_csv(uploaded_file)
-        return {"Sheet1": df}
+    if file_type in EXCEL_FILE_TYPES or file_type == "text/csv":
+        return list_sheets(file_digest(uploaded_file), uploaded_file.getvalue(), file_type)
     else:
         st.error("Invalid file type. Please upload an Excel or CSV file.")
         return None
 
-@st.cache_data
+# Function to load a single sheet of the uploaded file
+def load_sheet(uploaded_file, sheet_name):
+    return parse_sheet(file_digest(uploaded_file), uploaded_file.getvalue(), uploaded_file.type, sheet_name)
+
+# The rules template is static, so it is loaded once and shared across sessions without pickling
+@st.cache_resource
 def load_validation_rules():
-    return pd.read_excel("data_validation_rules_template_with_context.xlsx")
+    return pd.read_excel("data_validation_rules_template_with_context.xlsx", engine="calamine", usecols=["rule_type"])
+
+# Rule choices for the selector, materialized once instead of on every rerun
+@st.cache_resource
+def load_rule_types():
+    return tuple(load_validation_rules()['rule_type'].drop_duplicates())
+
+# Each rule maps to a (failing-cell mask, error messages for the failing values) pair
+VALIDATION_RULES = {
+    "contains_keyword_in_row": (
+        lambda values, param: ~values.str.contains(param, regex=False),
+        lambda bad, column, param: f"Keyword '{param}' not found in cell ({column})",
+    ),
+    "numeric_only": (
+        lambda values, param: ~values.str.isnumeric(),
+        lambda bad, column, param: ("Value '" + bad + "' is not numeric").to_numpy(),
+    ),
+    "fixed_length": (
+        lambda values, param: values.str.len().ne(int(param)),
+        lambda bad, column, param: ("Value '" + bad + f"' is not exactly {int(param)} characters long").to_numpy(),
+    ),
+}
+
+def validate_column(series, column, rule_type, param=None):
+    if rule_type not in VALIDATION_RULES:
+        return None
+    mask_fn, message_fn = VALIDATION_RULES[rule_type]
+
+    # Non-negative integers without gaps always print as digits, so skip the string scan
+    if (rule_type == "numeric_only" and pd.api.types.is_integer_dtype(series.dtype)
+            and not series.hasnans and bool((series >= 0).all())):
+        return None
+
+    # Work on a local Arrow-backed string copy so the (cached) uploaded frame is never
+    # mutated and the str kernels below run on packed UTF-8 instead of Python objects
+    # Datetimes are stringified per value, since the column-wide cast drops all-midnight
+    # times ('2024-01-01' instead of the '2024-01-01 00:00:00' the rules always saw)
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        series = series.map(str, na_action="ignore")
+    values = series.astype("string[pyarrow]")
+    if values.hasnans:
+        values = values.fillna('')
+
+    # Build the column's errors from the failing positions in one go
+    rows = np.flatnonzero(mask_fn(values, param).to_numpy(dtype=bool))
+    if not len(rows):
+        return None
+    return pd.DataFrame({
+        "Row": rows.astype(np.int64),
+        "Column": column,
+        "Error Message": message_fn(values.iloc[rows], column, param),
+    })
 
 def apply_validation(df, selected_columns, rule_type, param=None):
-    errors = []
-    for column in selected_columns:
-        if column not in df.columns:
-            continue
-        df[column] = df[column].fillna('')
-
-        if rule_type == "contains_keyword_in_row":
-            keyword = param
-            for idx, value in df[column].items():
-                if keyword not in str(value):
-                    errors.append((idx, column, f"Keyword '{keyword}' not found in cell ({column})"))
-
-        elif rule_type == "numeric_only":
-            for idx, value in df[column].items():
-                if not str(value).isnumeric():
-                    errors.append((idx, column, f"Value '{value}' is not numeric"))
-
-        elif rule_type == "fixed_length":
-            length = int(param)
-            for idx, value in df[column].items():
-                if len(str(value)) != length:
-                    errors.append((idx, column, f"Value '{value}' is not exactly {length} characters long"))
-
-    return errors
-
-def highlight_errors(df, error_list):
-    df_copy = df.copy()
-    error_indices = {(row, col) for row, col, _ in error_list}
-
-    def highlight(val, row_idx, col_name):
-        if (row_idx, col_name) in error_indices:
-            return 'background-color: red; color: white;'
-        return ''
-
-    styled_df = df_copy.style.apply(lambda col: [
-        highlight(val, idx, col.name) for idx, val in enumerate(col)
-    ], axis=0)
+    columns = [column for column in selected_columns if column in df.columns]
+
+    # Columns are independent and the Arrow string kernels release the GIL,
+    # so each selected column is validated on its own worker thread
+    with ThreadPoolExecutor() as executor:
+        error_frames = [
+            frame for frame in executor.map(
+                lambda column: validate_column(df[column], column, rule_type, param), columns
+            )
+            if frame is not None
+        ]
+
+    if not error_frames:
+        return pd.DataFrame({
+            "Row": np.empty(0, dtype=np.int64),
+            "Column": np.empty(0, dtype=object),
+            "Error Message": np.empty(0, dtype=object),
+        })
+    return pd.concat(error_frames, ignore_index=True)
+
+def highlight_errors(df, error_list, max_rows=MAX_HIGHLIGHT_ROWS):
+    # Only rows with errors are rendered (capped), so the Styler and the payload sent
+    # to the browser stay bounded however large the sheet is
+    errors = error_list[error_list["Column"].isin(df.columns)]
+    error_rows = np.unique(errors["Row"].to_numpy())[:max_rows]
+    errors = errors[errors["Row"].isin(error_rows)]
+
+    # Mark the failing cells in a boolean grid and style the frame in one vectorized pass
+    mask = np.zeros((len(error_rows), df.shape[1]), dtype=bool)
+    mask[np.searchsorted(error_rows, errors["Row"].to_numpy()), df.columns.get_indexer(errors["Column"])] = True
+    styles = np.where(mask, 'background-color: red; color: white;', '')
+
+    styled_df = df.iloc[error_rows].style.apply(lambda _: styles, axis=None)
     return styled_df
 
+# Convert a cell value to what xlsxwriter expects, plus the number format it needs
+# (mirrors what DataFrame.to_excel does, with blanks for missing values)
+def excel_value(value):
+    if pd.api.types.is_scalar(value) and pd.isna(value):
+        return None, None
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value), None
+    if isinstance(value, (int, np.integer)):
+        return int(value), None
+    if isinstance(value, (float, np.floating)):
+        # xlsxwriter rejects infinities; to_excel wrote them as 'inf' / '-inf' strings
+        if np.isinf(value):
+            return ('inf' if value > 0 else '-inf'), None
+        return float(value), None
+    if isinstance(value, datetime.datetime):
+        return value, "YYYY-MM-DD HH:MM:SS"
+    if isinstance(value, datetime.date):
+        return value, "YYYY-MM-DD"
+    if isinstance(value, datetime.timedelta):
+        return value.total_seconds() / 86400, "0"
+    return str(value), None
+
+# Create download file with the failing cells highlighted
+def create_excel(dataframe, error_list):
+    output = io.BytesIO()
+    # Rows are written in order, so constant_memory can flush each one instead of holding the sheet
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+    worksheet = workbook.add_worksheet("ValidatedData")
+
+    # Formats are shared per (error, number format) pair
+    formats = {}
+
+    def cell_format(is_error, num_format):
+        key = (is_error, num_format)
+        if key not in formats:
+            properties = {}
+            if is_error:
+                properties['bg_color'] = '#FF6666'
+            if num_format:
+                properties['num_format'] = num_format
+            formats[key] = workbook.add_format(properties) if properties else None
+        return formats[key]
+
+    # Headers keep their number format too, e.g. date labels read from an Excel header row
+    for col_idx, column in enumerate(dataframe.columns):
+        value, num_format = excel_value(column)
+        cell = cell_format(False, num_format)
+        if value is None:
+            if cell is not None:
+                worksheet.write_blank(0, col_idx, None, cell)
+        else:
+            worksheet.write(0, col_idx, value, cell)
+
+    # Error positions as row-sorted integer arrays, so each row's error columns are one slice
+    error_cols = dataframe.columns.get_indexer(error_list["Column"])
+    known = error_cols >= 0
+    error_rows = error_list["Row"].to_numpy()[known]
+    order = np.argsort(error_rows, kind="stable")
+    error_cols = error_cols[known][order].tolist()
+    row_bounds = np.searchsorted(error_rows[order], np.arange(len(dataframe) + 1)).tolist()
+
+    # Error cells get their format on the single write of each cell, so nothing is written twice
+    for row, record in enumerate(dataframe.itertuples(index=False, name=None)):
+        row_errors = error_cols[row_bounds[row]:row_bounds[row + 1]]
+        for col_idx, value in enumerate(record):
+            value, num_format = excel_value(value)
+            cell = cell_format(col_idx in row_errors, num_format)
+            if value is None:
+                if cell is not None:
+                    worksheet.write_blank(row + 1, col_idx, None, cell)
+            else:
+                worksheet.write(row + 1, col_idx, value, cell)
+
+    workbook.close()
+    output.seek(0)
+    return output
+
 def humanize_rule_name(rule_type):
     return rule_type.replace('_', ' ').title()
 
+# Validation controls and results run as a fragment, so interacting with them reruns
+# only this part instead of the whole script (upload handling and sheet preview)
+@st.fragment
+def validation_panel(df, selected_sheet):
+    columns = df.columns.tolist()
+    selected_columns = st.multiselect("🛠️ Select Columns to Validate", columns)
+
+    view_download_option = st.radio(
+        "👀 View & Download Option",
+        ("Selected Columns Only", "All Columns"),
+        horizontal=True
+    )
+
+    rule_types = load_rule_types()
+    selected_rule = st.selectbox("⚙️ Select Rule to Apply", rule_types)
+
+    param = None
+    if selected_rule == "contains_keyword_in_row":
+        param = st.text_input("🔑 Enter Keyword to Search")
+    elif selected_rule == "fixed_length":
+        param = st.number_input("🔢 Enter Fixed Length", min_value=1, step=1)
+
+    if st.button("🚀 Run Validation"):
+        with st.spinner("Validating..."):
+            validation_results = apply_validation(df, selected_columns, selected_rule, param)
+
+        if not validation_results.empty:
+            st.error(f"⚠️ Found {len(validation_results)} validation issues.")
+
+            # Select dataframe based on pre-chosen view option
+            if view_download_option == "Selected Columns Only":
+                df_to_show = df[selected_columns]
+                df_for_download = df[selected_columns]
+            else:
+                df_to_show = df
+                df_for_download = df
+
+            st.subheader("📊 Highlighted DataFrame with Errors")
+            styled_df = highlight_errors(df_to_show, validation_results)
+            st.dataframe(styled_df)
+            if validation_results["Row"].nunique() > MAX_HIGHLIGHT_ROWS:
+                st.caption(f"Showing the first {MAX_HIGHLIGHT_ROWS} rows with errors. Download the file for the full result.")
+
+            output_excel = create_excel(df_for_download, validation_results)
+            rule_label = humanize_rule_name(selected_rule)
+
+            st.download_button(
+                label=f"📥 Download Validated File ({rule_label})",
+                data=output_excel,
+                file_name=f"{selected_sheet}_{rule_label}_validated.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            )
+
+        else:
+            st.balloons()
+            st.success("✅ No validation errors found! Your data looks perfect 🎉")
+
 # Streamlit UI
 st.set_page_config(page_title="Data Validation Agent AI", page_icon="✅", layout="wide")
 st.title('🛡️ Data Validation Agent AI')
@@ -70,87 +298,19 @@ st.title('🛡️ Data Validation Agent AI')
 uploaded_file = st.file_uploader("📤 Upload your file (CSV or Excel)", type=["csv", "xlsx"])
 
 if uploaded_file:
-    data = load_file(uploaded_file)
-    validation_rules = load_validation_rules()
+    sheet_names = load_file(uploaded_file)
 
-    if data:
-        sheet_names = list(data.keys())
+    if sheet_names:
         selected_sheet = st.selectbox("📄 Select Sheet to Validate", sheet_names)
 
         if selected_sheet:
-            df = data[selected_sheet]
+            df = load_sheet(uploaded_file, selected_sheet)
             st.subheader(f"🔍 Preview of `{selected_sheet}`")
-            st.dataframe(df)
-
-            columns = df.columns.tolist()
-            selected_columns = st.multiselect("🛠️ Select Columns to Validate", columns)
-
-            view_download_option = st.radio(
-                "👀 View & Download Option",
-                ("Selected Columns Only", "All Columns"),
-                horizontal=True
-            )
+            st.dataframe(df.head(PREVIEW_ROWS))
+            if len(df) > PREVIEW_ROWS:
+                st.caption(f"Showing the first {PREVIEW_ROWS} of {len(df)} rows.")
 
-            rule_types = validation_rules['rule_type'].unique().tolist()
-            selected_rule = st.selectbox("⚙️ Select Rule to Apply", rule_types)
-
-            param = None
-            if selected_rule == "contains_keyword_in_row":
-                param = st.text_input("🔑 Enter Keyword to Search")
-            elif selected_rule == "fixed_length":
-                param = st.number_input("🔢 Enter Fixed Length", min_value=1, step=1)
-
-            if st.button("🚀 Run Validation"):
-                with st.spinner("Validating..."):
-                    validation_results = apply_validation(df, selected_columns, selected_rule, param)
-
-                if validation_results:
-                    st.error(f"⚠️ Found {len(validation_results)} validation issues.")
-
-                    # Select dataframe based on pre-chosen view option
-                    if view_download_option == "Selected Columns Only":
-                        df_to_show = df[selected_columns]
-                        df_for_download = df[selected_columns]
-                    else:
-                        df_to_show = df
-                        df_for_download = df
-
-                    st.subheader("📊 Highlighted DataFrame with Errors")
-                    styled_df = highlight_errors(df_to_show, validation_results)
-                    st.dataframe(styled_df)
-
-                    # Create download file
-                    def create_excel(dataframe):
-                        output = io.BytesIO()
-                        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                            dataframe.to_excel(writer, index=False, sheet_name="ValidatedData")
-                            workbook = writer.book
-                            worksheet = writer.sheets["ValidatedData"]
-
-                            error_indices = {(row, col) for row, col, _ in validation_results}
-                            if set(dataframe.columns).issubset(set(df.columns)):
-                                red_format = workbook.add_format({'bg_color': '#FF6666'})
-                                for row, column, _ in validation_results:
-                                    if column in dataframe.columns:
-                                        col_idx = dataframe.columns.get_loc(column)
-                                        worksheet.write(row + 1, col_idx, dataframe.iloc[row, col_idx], red_format)
-
-                        output.seek(0)
-                        return output
-
-                    output_excel = create_excel(df_for_download)
-                    rule_label = humanize_rule_name(selected_rule)
-
-                    st.download_button(
-                        label=f"📥 Download Validated File ({rule_label})",
-                        data=output_excel,
-                        file_name=f"{selected_sheet}_{rule_label}_validated.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                    )
-
-                else:
-                    st.balloons()
-                    st.success("✅ No validation errors found! Your data looks perfect 🎉")
+            validation_panel(df, selected_sheet)
 
 else:
     st.info("📂 Please upload a file to begin.")